@@ -7,6 +7,23 @@ import yaml
 import re
 import argparse
 import shutil
+import signal
+import threading
+import select
+import collections
+import concurrent.futures
+import functools
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, the limits are then enforced by the timeout script
+    resource = None
 
 USELIMITS = True
 # Timeout in Seconds
@@ -20,9 +37,16 @@ _TIMEOUTSCRIPT = os.path.join(os.path.dirname(
 mcrl2_Path = os.path.join(os.path.dirname(os.path.realpath(
     __file__)), '../../../mcrl2experimentalinstall/mCRL2/stage/bin/')
 
+# Path to GAP, which pbessolve uses to compute with the symmetry groups
+_GAP_PATH = shutil.which("gap")
+_GAP_PATH_ARG = "--gap-path={}".format(_GAP_PATH)
+
+# Options of pbessolve that are the same for every run
+_PBESSOLVE_OPTIONS = ("-v", "-rjittyc", "--long-strategy=0", "--timings")
+
 # path to folder 'properties'
-prop_path = os.path.abspath(os.path.join(
-    os.path.split(__file__)[0], 'properties'))
+# os.path.abspath does not follow symbolic links, unlike Path.resolve
+prop_path = pathlib.Path(os.path.abspath(pathlib.Path(__file__).parent / 'properties'))
 
 # Set of models
 MODELS_XS = {"mutex"}
@@ -45,12 +69,42 @@ WORKFLOWS_CHOSEN = ["chosen"]
 WORKFLOWS_FIRST = ["original", "first"]
 WORKFLOWS_ALL = ["original", "all"]
 
+# Values of the --selection and --workflow options
+SELECTIONS = {"xs": MODELS_XS, "s": MODELS_S, "m": MODELS_M, "l": MODELS_L, "xl": MODELS_XL}
+WORKFLOWS = {"first-chosen": WORKFLOWS_FIRST_CHOSEN, "chosen": WORKFLOWS_CHOSEN,
+             "first": WORKFLOWS_FIRST, "all": WORKFLOWS_ALL}
+
 REWRITEPROPERTIES = ["no_conf_before_req", "no_con_query", "no_inf_eat"]
 
+# Markers of the lines of interest in the output of the tools. The value of a
+# line follows its marker, possibly after a prefix added by the logger
+_VALUE_MARKERS = (("instantiation", "instantiation:", float),
+                  ("solving", "solving:", float),
+                  ("explicit", "Generated ", int))
+_SYMMETRY_MARKER = "Found symmetry:"
+
+# Markers of the reasons for a tool to fail
+_FAILURE_MARKERS = (("timeout", ("TIMEOUT CPU ",)),
+                    # Hitting RLIMIT_AS makes allocations fail, which most tools report and exit
+                    ("outofmemory", ("MEM CPU ", "std::bad_alloc", "memory allocation of ",
+                                     "Cannot allocate memory", "out of memory", "Out of memory",
+                                     "MemoryError", "cannot extend the workspace")),
+                    ("mdd", ("MDD Unique table full",)),
+                    ("srf", ("The PBES after removing counter example information",)))
+
+_RE_CYCLE = re.compile(r"\([^)]*\)")
+_RE_PAREN = re.compile(r"\(([^()]*)\)")
+_RE_DIGITS = re.compile(r"\d+")
 
+# Number of lines of standard error that are kept to report a failing tool
+_STDERR_TAIL = 200
+
+
+# The exceptions pass their arguments to Exception, such that they can be pickled
+# to report a failing model from a worker process
 class ToolException(Exception):
     def __init__(self, tool, exitcode, result):
-        Exception.__init__(self)
+        Exception.__init__(self, tool, exitcode, result)
         self.result = result
         self.__ret = exitcode
         self.__cmdline = ' '.join(tool)
@@ -62,7 +116,7 @@ class ToolException(Exception):
 
 class Timeout(Exception):
     def __init__(self, cmdline, result):
-        super(Timeout, self).__init__()
+        super(Timeout, self).__init__(cmdline, result)
         self.__cmdline = ' '.join(cmdline)
         self.result = result
 
@@ -72,10 +126,13 @@ class Timeout(Exception):
 
 class OutOfMemory(Exception):
     def __init__(self, cmdline, result):
-        super(OutOfMemory, self).__init__()
+        super(OutOfMemory, self).__init__(cmdline, result)
         self.__cmdline = ' '.join(cmdline)
         self.result = result
 
+    def __str__(self):
+        return 'The commandline "{0}" ran out of memory'.format(self.__cmdline)
+
 
 def split_input_filename(input_path):
     """Split the input path into directory and basename of the file"""
@@ -113,66 +170,222 @@ def property_filepath(dirname, property_name):
     return os.path.join(dirname, mcf_filename)
 
 
-def regex_explicit(input):
-    if re.match(r"(?s:.*)Generated ([+\-]?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+\-]?\d+)?)", input):
-        result = re.match(
-            r"(?s:.*)Generated ([+\-]?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+\-]?\d+)?)", input)
-    else:
-        result = ''
-    return result
+def new_output():
+    """Returns the results of a tool before any of its output has been read"""
+    return {"instantiation": None, "solving": None, "explicit": None, "symmetries": [],
+            "timeout": False, "outofmemory": False, "mdd": False, "srf": False,
+            "tail": collections.deque(maxlen=_STDERR_TAIL)}
 
 
-def regex_solve(input):
-    if re.match(r"(?s:.*)solving:( *)([+\-]?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+\-]?\d+)?)", input):
-        result = re.match(
-            r"(?s:.*)solving:( *)([+\-]?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+\-]?\d+)?)", input)
-    else:
-        result = ''
-    return result
+def read_line(output, line):
+    """Updates output with the results found in a line of the standard error of a tool.
+    Only the last _STDERR_TAIL lines are kept to report failures."""
+    logging.debug(line.rstrip("\n"))
+    output["tail"].append(line)
 
+    for kind, marker, convert in _VALUE_MARKERS:
+        _, found, tail = line.partition(marker)
+        if found:
+            words = tail.split(maxsplit=1)
+            try:
+                # Later occurrences take precedence over earlier ones
+                output[kind] = convert(words[0])
+            except (IndexError, ValueError):
+                pass
 
-def regex_inst(input):
-    if re.match(r"(?s:.*)instantiation:( *)([+\-]?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+\-]?\d+)?)", input):
-        result = re.match(
-            r"(?s:.*)instantiation:( *)([+\-]?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+\-]?\d+)?)", input)
-    else:
-        result = ''
-    return result
+    _, found, tail = line.partition(_SYMMETRY_MARKER)
+    if found:
+        tail = tail.strip()
+        if _RE_CYCLE.search(tail):
+            output["symmetries"].append(tail)
 
+    for kind, markers in _FAILURE_MARKERS:
+        if any(marker in line for marker in markers):
+            output[kind] = True
 
-def regex_symmetries(input):
-    line_re = re.compile(r"^.*Found symmetry:\s*(.+)$", re.MULTILINE)
 
-    symmetries = []
-    for m in line_re.finditer(input):
-        tail = m.group(1).strip()
-        if re.search(r"\([^)]*\)", tail):
-            symmetries.append(tail)
-    return symmetries
+def pidfd_supported():
+    """Returns true iff the termination of children can be observed with os.pidfd_open (Linux 5.3)"""
+    try:
+        os.close(os.pidfd_open(os.getpid()))
+        return True
+    except (AttributeError, OSError):
+        return False
+
+
+_PIDFD_SUPPORTED = pidfd_supported()
+
+
+class ChildSupervisor:
+    """Runs tools and harvests them in a single poll loop. The output of every tool
+    is read from its pipes as it becomes available and its termination is observed
+    through a pidfd, so there is no need for a thread per tool or to busy wait."""
+
+    def __init__(self):
+        self.__poll = select.poll()
+        self.__fds = {}
+        self.__children = []
+
+    def submit(self, command, stderr_sink, preexec_fn=None):
+        """Starts command, every line that it writes to standard error is passed to stderr_sink.
+        The optional preexec_fn is called in the child process before command is executed."""
+        proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                preexec_fn=preexec_fn)
+        child = {"proc": proc, "sink": stderr_sink, "stdout": [], "stderr": b"",
+                 "pidfd": os.pidfd_open(proc.pid)}
+
+        for kind, fd in (("stdout", proc.stdout.fileno()), ("stderr", proc.stderr.fileno()),
+                         ("pidfd", child["pidfd"])):
+            os.set_blocking(fd, False)
+            self.__poll.register(fd, select.POLLIN)
+            self.__fds[fd] = (child, kind)
+
+        self.__children.append(child)
+        return proc
+
+    def harvest(self):
+        """Waits until all submitted tools have terminated and returns a list with for
+        every tool its process and standard output"""
+        while self.__fds:
+            for fd, _ in self.__poll.poll():
+                if fd not in self.__fds:
+                    continue
+
+                child, kind = self.__fds[fd]
+                if kind == "pidfd":
+                    child["proc"].wait()
+                    self.__finish(child)
+                elif self.__read(child, kind, fd) == b"":
+                    self.__unregister(fd)
+
+        children, self.__children = self.__children, []
+        return [(child["proc"], b"".join(child["stdout"]).decode(errors="replace"))
+                for child in children]
+
+    def __read(self, child, kind, fd):
+        """Reads the available output of a child and returns it, which is empty when the
+        pipe is closed and None when no output is available yet"""
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return None
 
+        if kind == "stdout":
+            child["stdout"].append(data)
+        else:
+            *lines, child["stderr"] = (child["stderr"] + data).split(b"\n")
+            for line in lines:
+                child["sink"](line.decode(errors="replace") + "\n")
+        return data
+
+    def __finish(self, child):
+        """Reads the output that a terminated child left in its pipes and closes them"""
+        proc = child["proc"]
+        for kind, fd in (("stdout", proc.stdout.fileno()), ("stderr", proc.stderr.fileno())):
+            if fd in self.__fds:
+                # Stops at the end of the pipe, or when a descendant of the child still holds it open
+                while self.__read(child, kind, fd):
+                    pass
+                self.__unregister(fd)
+
+        if child["stderr"]:
+            child["sink"](child["stderr"].decode(errors="replace"))
+        self.__unregister(child["pidfd"])
+        os.close(child["pidfd"])
+        proc.stdout.close()
+        proc.stderr.close()
+
+    def __unregister(self, fd):
+        if fd in self.__fds:
+            self.__poll.unregister(fd)
+            del self.__fds[fd]
+
+
+def limit_resources(timeout, memlimit):
+    """Limits the CPU time in seconds and the memory in KBytes of the current process.
+    Exceeding the CPU time results in SIGXCPU, and in SIGKILL a second later for a
+    process that handles SIGXCPU. Exceeding the memory makes allocations fail."""
+    if timeout is not None:
+        resource.setrlimit(resource.RLIMIT_CPU, (timeout, timeout + 1))
+    if memlimit is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memlimit * 1024, memlimit * 1024))
+
+
+def limit_command(command, timeout, memlimit):
+    """Returns the command and the function to run in the child process to limit the
+    time and memory of command. The limits are set by the child itself where possible,
+    otherwise command is wrapped by the timeout script.
+
+    Note that the limits differ from those of the timeout script: setrlimit limits the
+    CPU time and virtual memory of every process separately, where the timeout script
+    limits the CPU time and resident memory of the whole process tree. So the children
+    of a tool, such as gap and the jittyc compiler, each get the full limits."""
+    if (timeout is None and memlimit is None) or not USELIMITS:
+        return command, None
+
+    if resource is not None:
+        return command, functools.partial(limit_resources, timeout, memlimit)
+
+    if not os.path.exists(_TIMEOUTSCRIPT):
+        logging.error(
+            'The script {0} does not exists, cannot run without it'.format(_TIMEOUTSCRIPT))
+        raise Exception('File {0} not found'.format(_TIMEOUTSCRIPT))
 
-def cycles_to_function_notation(cycles_str):
-    cycle_texts = re.findall(r"\(([^()]*)\)", cycles_str)
+    timeoutcmd = [_TIMEOUTSCRIPT, '--confess', '--no-info-on-success']
+    if timeout is not None:
+        timeoutcmd += ['-t', str(timeout)]
+    if memlimit is not None:
+        timeoutcmd += ['-m', str(memlimit)]
+
+    return timeoutcmd + command, None
 
+
+def children_cputime():
+    """Returns the CPU time in seconds used by the terminated children of this process, including their descendants"""
+    if resource is None:
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def execute(command, preexec_fn=None):
+    """Runs command and returns its exit code, standard output and the results read from its standard error"""
+    output = new_output()
+
+    if _PIDFD_SUPPORTED:
+        supervisor = ChildSupervisor()
+        supervisor.submit(command, lambda line: read_line(output, line), preexec_fn)
+        [(proc, stdout)] = supervisor.harvest()
+        return proc.returncode, stdout, output
+
+    proc = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, bufsize=1, preexec_fn=preexec_fn)
+
+    # Drain the standard output concurrently such that neither pipe can fill up and block the tool
+    stdout = []
+    reader = threading.Thread(target=lambda: stdout.append(proc.stdout.read()))
+    reader.start()
+    for line in proc.stderr:
+        read_line(output, line)
+    reader.join()
+    proc.wait()
+
+    return proc.returncode, "".join(stdout), output
+
+
+@functools.lru_cache(maxsize=1024)
+def cycles_to_function_notation(cycles_str):
     mapping_pairs = []
-    for ctext in cycle_texts:
-        ctext = ctext.strip()
-        if not ctext:
-            continue
+    for cycle in _RE_PAREN.finditer(cycles_str):
+        ctext = cycle.group(1).strip()
 
-        if " " not in ctext and re.fullmatch(r"\d+", ctext):
+        if " " not in ctext and _RE_DIGITS.fullmatch(ctext):
             elements = list(ctext)
         else:
-            elements = re.findall(r"\d+", ctext)
+            elements = _RE_DIGITS.findall(ctext)
 
-        if len(elements) == 1:
-            a = elements[0]
-            mapping_pairs.append((a, a))
-        else:
-            for i in range(len(elements)):
-                src = elements[i]
-                dst = elements[(i + 1) % len(elements)]
-                mapping_pairs.append((src, dst))
+        # Every element maps to its successor in the cycle, a single element maps to itself
+        mapping_pairs.extend(zip(elements, elements[1:] + elements[:1]))
 
     if not mapping_pairs:
         return "[]"
@@ -180,14 +393,15 @@ def cycles_to_function_notation(cycles_str):
     return "[ " + ", ".join(f"{a} -> {b}" for a, b in mapping_pairs) + " ]"
 
 
+def longest_cycle_length(cycle_str):
+    return max((len(m.group(1).split()) for m in _RE_PAREN.finditer(cycle_str)), default=0)
+
+
 def element_with_longest_cycle(cycle_list):
-    def longest_cycle_length(cycle_str):
-        cycles = re.findall(r'\((.*?)\)', cycle_str)
-        lengths = [len(c.split()) for c in cycles]
-        return max(lengths) if lengths else 0
     return max(cycle_list, key=longest_cycle_length)
 
 
+@functools.lru_cache(maxsize=None)
 def get_chosen_symmetry(model, property):
     path = f"symmetries/{model}/{model}_{property}.txt"
 
@@ -195,82 +409,60 @@ def get_chosen_symmetry(model, property):
         return f.read()
 
 
-def listToString(s):
-    str1 = ""
-    return (str1.join(s))
-
-
-def run_command(mcrl2_path, tool, options, input_file, output_file=None, timeout=None, memlimit=None):
+def run_command(mcrl2_path, tool, options, *inputs, input_keys=("input_file",), output_file=None,
+                timeout=None, memlimit=None):
+    """Runs tool on the input files and returns its results. Every input file is recorded in
+    the results under the corresponding key of input_keys."""
     data = {}
-    data["options"] = listToString(options)
-    data["input_file"] = input_file
+    data["options"] = " ".join(options)
+    for key, input_file in zip(input_keys, inputs, strict=True):
+        data[key] = input_file
     output_file_arg = []
     if output_file:
         data["output_file"] = output_file
         output_file_arg = [output_file]
-    command = [os.path.join(mcrl2_path, tool)] + \
-        options + [input_file] + output_file_arg
+    command = [os.path.join(mcrl2_path, tool), *options, *inputs, *output_file_arg]
     start_time = time.time()  # Start time of the command execution
-    timeoutcmd = []
-    if (timeout is not None or memlimit is not None) and USELIMITS:
-        if not os.path.exists(_TIMEOUTSCRIPT):
-            logging.error(
-                'The script {0} does not exists, cannot run without it'.format(_TIMEOUTSCRIPT))
-            raise Exception('File {0} not found'.format(_TIMEOUTSCRIPT))
-
-        timeoutcmd += [_TIMEOUTSCRIPT, '--confess', '--no-info-on-success']
-        if timeout is not None:
-            timeoutcmd += ['-t', str(timeout)]
-        if memlimit is not None:
-            timeoutcmd += ['-m', str(memlimit)]
-
-        command = timeoutcmd + command
-
-    proc = subprocess.run(command, check=False, capture_output=True, text=True)
-
-    if proc.returncode != 0:
-        # Filter the output to see whether we exceeded time or memory:
-        TIMEOUT_RE = 'TIMEOUT CPU (?P<cpu>\d+[.]\d*) MEM (?P<mem>\d+) MAXMEM (?P<maxmem>\d+) STALE (?P<stale>\d+)'
-        m = re.search(TIMEOUT_RE, str(proc.stderr), re.DOTALL)
-        if m is not None:
+    command, preexec_fn = limit_command(command, timeout, memlimit)
+    cputime = children_cputime()
+    returncode, stdout, output = execute(command, preexec_fn)
+    cputime = children_cputime() - cputime
+
+    if returncode != 0:
+        # Filter the output to see whether we exceeded time or memory. A tool that
+        # handles SIGXCPU is killed when it exceeds the hard limit on its CPU time.
+        killed_by_cpu_limit = (returncode == -signal.SIGKILL and resource is not None
+                               and timeout is not None and cputime >= timeout)
+        if output["timeout"] or returncode == -signal.SIGXCPU or killed_by_cpu_limit:
             data['times'] = 'timeout'
             raise Timeout(command, data)
 
-        MEMLIMIT_RE = 'MEM CPU (?P<cpu>\d+[.]\d*) MEM (?P<mem>\d+) MAXMEM (?P<maxmem>\d+) STALE (?P<stale>\d+)'
-        m = re.search(MEMLIMIT_RE, str(proc.stderr), re.DOTALL)
-        if m is not None:
+        if output["outofmemory"] or returncode == -signal.SIGKILL:
             data['times'] = 'outofmemory'
             raise OutOfMemory(command, data)
 
-        MDD = 'MDD Unique table full(.*)'
-        mdd = re.search(MDD, str(proc.stderr))
-        if mdd is not None:
+        if output["mdd"]:
             print('MDD Unique table full')
             data['error'] = 'MDD Unique table full'
-        SRF = 'The PBES after removing counter example information(.*)'
-        srf = re.search(SRF, str(proc.stderr))
-        if srf is not None:
+        if output["srf"]:
             print('PBES is not in SRF')
             data['error'] = "PBES is not in SRF"
 
-        raise ToolException(command, proc.returncode, {
-                            'err': proc.stderr, 'out': proc.stdout})
+        raise ToolException(command, returncode, {
+                            'err': "".join(output["tail"]), 'out': stdout})
 
     end_time = time.time()
     elapsed_time = end_time - start_time
-    logging.debug(proc.stderr)
     data["totaltime"] = float('%.3f' % (elapsed_time))
 
     if "merc-pbes" in os.path.join(mcrl2_path, tool):
-        string = str(proc.stderr)
-        symmetries = regex_symmetries(string)
-        data["symmetries"] = symmetries
+        data["symmetries"] = output["symmetries"]
 
     if "pbessolve" in os.path.join(mcrl2_path, tool):
-        if re.match(r"false", str(proc.stdout)):
+        if stdout.startswith("false"):
             data["answer"] = 'false'
             ans = 'false'
-        elif re.match(r"true", str(proc.stdout)):
+        elif stdout.startswith("true"):
             data["answer"] = 'true'
             ans = 'true'
         else:
@@ -278,24 +470,19 @@ def run_command(mcrl2_path, tool, options, input_file, output_file=None, timeout
             ans = '-'
         print("Answer {}".format(ans))
         # to save the specific times
-        string = str(proc.stderr)
-        resultinst = regex_inst(string)
-        data["instantiation"] = eval(resultinst.group(2))
-        inst = eval(resultinst.group(2))
-        resultsolve = regex_solve(string)
-        data["solving"] = eval(resultsolve.group(2))
-        sol = eval(resultsolve.group(2))
+        inst = output["instantiation"]
+        data["instantiation"] = inst
+        sol = output["solving"]
+        data["solving"] = sol
         ttime = inst + sol
         print("Time {}".format(ttime))
         data['time'] = float('%.3f' % (ttime))
 
         # to save the number of BES equations
-        string = str(proc.stderr)
-        result = regex_explicit(string)
-        if result != '':
-            data["generated_bes_equations"] = eval(result.group(1))
-            print("Generated vertices in parity game {}".format(
-                str(result.group(1))))
+        result = output["explicit"]
+        if result is not None:
+            data["generated_bes_equations"] = result
+            print("Generated vertices in parity game {}".format(result))
         else:
             data["generated_bes_equations"] = 0
             print('empty')
@@ -303,66 +490,13 @@ def run_command(mcrl2_path, tool, options, input_file, output_file=None, timeout
     return data
 
 
-def run_command_2(mcrl2_path, tool, options, input_file, input_file2, output_file=None, timeout=None, memlimit=None):
-    data = {}
-    data["options"] = listToString(options)
-    data["mcf_file"] = input_file
-    data["lps_file"] = input_file2
-    output_file_arg = []
-    if output_file:
-        data["output_file"] = output_file
-        output_file_arg = [output_file]
-    command = [os.path.join(mcrl2_path, tool)] + options + \
-        [input_file] + [input_file2] + output_file_arg
-    start_time = time.time()  # Start time of the command execution
-
-    timeoutcmd = []
-    if (timeout is not None or memlimit is not None) and USELIMITS:
-        if not os.path.exists(_TIMEOUTSCRIPT):
-            logging.error(
-                'The script {0} does not exists, cannot run without it'.format(_TIMEOUTSCRIPT))
-            raise Exception('File {0} not found'.format(_TIMEOUTSCRIPT))
-
-        timeoutcmd += [_TIMEOUTSCRIPT, '--confess', '--no-info-on-success']
-        if timeout is not None:
-            timeoutcmd += ['-t', str(timeout)]
-        if memlimit is not None:
-            timeoutcmd += ['-m', str(memlimit)]
-
-        command = timeoutcmd + command
-
-    proc = subprocess.run(command, check=False, capture_output=True, text=True)
-
-    if proc.returncode != 0:
-        # Filter the output to see whether we exceeded time or memory:
-        TIMEOUT_RE = 'TIMEOUT CPU (?P<cpu>\d+[.]\d*) MEM (?P<mem>\d+) MAXMEM (?P<maxmem>\d+) STALE (?P<stale>\d+)'
-        m = re.search(TIMEOUT_RE, str(proc.stderr), re.DOTALL)
-        if m is not None:
-            data['times'] = 'timeout'
-            raise Timeout(command, data)
-
-        MEMLIMIT_RE = 'MEM CPU (?P<cpu>\d+[.]\d*) MEM (?P<mem>\d+) MAXMEM (?P<maxmem>\d+) STALE (?P<stale>\d+)'
-        m = re.search(MEMLIMIT_RE, str(proc.stderr), re.DOTALL)
-        if m is not None:
-            data['times'] = 'outofmemory'
-            raise OutOfMemory(command, data)
-        raise ToolException(command, proc.returncode, {
-                            'err': proc.stderr, 'out': proc.stdout})
-
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    logging.debug(proc.stderr)
-    data["totaltime"] = float('%.3f' % (elapsed_time))
-    return data
-
-
 def mcrl2_to_lps(dirname, root, mcrl2=mcrl2_Path):
     mcrl2file = mcrl2_filepath(dirname, root)
     lpsfile = lps_filepath(dirname, root)
 
     logging.info("Translating mCRL2 specification {} to LPS {}".format(
         mcrl2file, lpsfile))
-    data = run_command(mcrl2, "mcrl22lps", ["-nf"], mcrl2file, lpsfile)
+    data = run_command(mcrl2, "mcrl22lps", ["-nf"], mcrl2file, output_file=lpsfile)
     logging.info("Successfully finished translating mCRL2 specification.")
 
     return data
@@ -380,28 +514,26 @@ def mcrl2_to_lps_suminst_fununfold(dirname, root, mcrl2=mcrl2_Path):
 
     logging.info("Translating mCRL2 specification {} to LPS {}".format(
         mcrl2file, lpsfiletmp))
-    data = run_command(mcrl2, "mcrl22lps", ["-nf"], mcrl2file, lpsfile)
-    data.update(run_command(mcrl2, "lpssuminst", [], lpsfile, lpssuminstfile))
+    data = run_command(mcrl2, "mcrl22lps", ["-nf"], mcrl2file, output_file=lpsfile)
+    data.update(run_command(mcrl2, "lpssuminst", [], lpsfile, output_file=lpssuminstfile))
     data.update(run_command(mcrl2, "lpsfununfold", [],
-                lpssuminstfile, lpssuminstlpsfununfoldfile))
+                lpssuminstfile, output_file=lpssuminstlpsfununfoldfile))
     data.update(run_command(mcrl2, "lpsrewr", [],
-                lpssuminstlpsfununfoldfile, lpsfile))
+                lpssuminstlpsfununfoldfile, output_file=lpsfile))
     logging.info("Successfully finished translating mCRL2 specification.")
 
     return data
 
 
-def lps_to_pbes(dirname, dirname2, root, property_name, mcrl2=mcrl2_Path, hint=None):
-    lpsfile = lps_filepath(dirname, root)
-    mcffile = property_filepath(dirname2, property_name)
-    pbesfile = pbes_filepath(dirname, root, property_name)
+def lps_to_pbes(lpsfile, mcffile, pbesfile, mcrl2=mcrl2_Path, memlimit=MEMLIMIT):
     lps2pbesdata = {}
     logging.info("Translating property and LPE specification {},{} to PBES {}".format(
         mcffile, lpsfile, pbesfile))
     try:
         print("Trying lps2pbes")
-        lps2pbesdata = run_command_2(mcrl2, "lps2pbes", ["-v", "-f"], mcffile, lpsfile, pbesfile, timeout=TIMEOUT,
-                                     memlimit=MEMLIMIT)
+        lps2pbesdata = run_command(mcrl2, "lps2pbes", ["-v", "-f"], mcffile, lpsfile,
+                                   input_keys=("mcf_file", "lps_file"), output_file=pbesfile,
+                                   timeout=TIMEOUT, memlimit=memlimit)
         logging.info("Successfully generated PBES from property and LPE.")
 
     except (ToolException, Timeout, OutOfMemory) as e:
@@ -412,18 +544,15 @@ def lps_to_pbes(dirname, dirname2, root, property_name, mcrl2=mcrl2_Path, hint=N
     return lps2pbesdata
 
 
-def pbes_rewr(dirname, dirname2, root, property_name, mcrl2=mcrl2_Path, hint=None):
-    pbesfile = pbes_filepath(dirname, root, property_name)
-    pbesfiletmp = pbes_filepath(dirname, root, property_name, "tmp")
-
+def pbes_rewr(pbesfile, pbesfiletmp, mcrl2=mcrl2_Path):
     logging.info("Rewriting {} with ppg".format(pbesfile))
     try:
         print("Trying pbesrewr")
         data = run_command(mcrl2, "pbesrewr", [
-                           "-v", "-pppg"], pbesfile, pbesfiletmp)
+                           "-v", "-pppg"], pbesfile, output_file=pbesfiletmp)
         logging.info("Rewriting {} with quantifier-all".format(pbesfile))
         data.update(run_command(mcrl2, "pbesrewr", [
-                    "-v", "-pquantifier-all"], pbesfiletmp, pbesfile))
+                    "-v", "-pquantifier-all"], pbesfiletmp, output_file=pbesfile))
         logging.info("Successfully finished rewriting PBES.")
 
     except (ToolException, Timeout, OutOfMemory) as e:
@@ -434,9 +563,8 @@ def pbes_rewr(dirname, dirname2, root, property_name, mcrl2=mcrl2_Path, hint=Non
     return data
 
 
-def pbes_symmetry(dirname, root, property_name, mcrl2=mcrl2_Path, hint=None):
+def pbes_symmetry(pbesfile, mcrl2=mcrl2_Path, hint=None, memlimit=MEMLIMIT):
     mcrl2mercpath = "../../../mcrl2merc/merc/tools/mcrl2/target/release/"
-    pbesfile = pbes_filepath(dirname, root, property_name)
     data = {}
     logging.info(
         "Trying to extract symmetry for PBES-SRF {}".format(pbesfile))
@@ -445,13 +573,13 @@ def pbes_symmetry(dirname, root, property_name, mcrl2=mcrl2_Path, hint=None):
         if hint == "all":
             data = run_command(mcrl2mercpath, "merc-pbes", ["symmetry", "--partition-data-sorts", "--partition-data-updates", "--all-symmetries"],
                                pbesfile, timeout=TIMEOUT,
-                               memlimit=MEMLIMIT)
+                               memlimit=memlimit)
             logging.info("Successfully ran pbessymmetry for all symmetries.")
             print("Time: {}".format(data["totaltime"]))
         elif hint == "first":
             data = run_command(mcrl2mercpath, "merc-pbes", ["symmetry", "--partition-data-sorts", "--partition-data-updates"],
                                pbesfile, timeout=TIMEOUT,
-                               memlimit=MEMLIMIT)
+                               memlimit=memlimit)
             logging.info("Successfully ran pbessymmetry for first symmetry.")
             print("Time: {}".format(data["totaltime"]))
         else:
@@ -466,17 +594,14 @@ def pbes_symmetry(dirname, root, property_name, mcrl2=mcrl2_Path, hint=None):
     return data
 
 
-def pbes_solve(dirname, root, property_name, mcrl2, hint, symmetry="[0->0]", arg=""):
-    pbesfile = pbes_filepath(dirname, root, property_name, arg)
+def pbes_solve(pbesfile, mcrl2, hint, symmetry="[0->0]", memlimit=MEMLIMIT):
     solving_data = {}
     logging.info("Solving explicitly PBES {}".format(pbesfile))
     try:
         print("Trying pbessolve with {}".format(hint))
         symmetry_argument = "--symmetry={}".format(symmetry)
-        gap_path = shutil.which("gap")
-        gap_path_argument = "--gap-path={}".format(gap_path)
-        solving_data = run_command(mcrl2, "pbessolve", [
-            "-v", "-rjittyc", "--long-strategy=0", "--timings", symmetry_argument, gap_path_argument], pbesfile, timeout=TIMEOUT, memlimit=MEMLIMIT)
+        solving_data = run_command(mcrl2, "pbessolve", [*_PBESSOLVE_OPTIONS, symmetry_argument, _GAP_PATH_ARG],
+                                   pbesfile, timeout=TIMEOUT, memlimit=memlimit)
         logging.info("Successfully solved explicit PBES.")
 
     except (ToolException, Timeout, OutOfMemory) as e:
@@ -491,8 +616,7 @@ def pbes_solve(dirname, root, property_name, mcrl2, hint, symmetry="[0->0]", arg
     return solving_data
 
 
-def pbes_solve_symmetry(dirname, root, property_name, mcrl2, arg, symmetry):
-    pbesfile = pbes_filepath(dirname, root, property_name, arg)
+def pbes_solve_symmetry(pbesfile, mcrl2, symmetry, memlimit=MEMLIMIT):
     solving_data = {}
     logging.info("Solving with symmetry PBES {}".format(pbesfile))
     try:
@@ -502,10 +626,8 @@ def pbes_solve_symmetry(dirname, root, property_name, mcrl2, arg, symmetry):
             symmetry_argument = "--symmetry=[]"
         else:
             symmetry_argument = "--symmetry={}".format(symmetry_function)
-        gap_path = shutil.which("gap")
-        gap_path_argument = "--gap-path={}".format(gap_path)
-        solving_data = run_command(mcrl2, "pbessolve", ["-v", "-rjittyc", "--long-strategy=0",
-                                   "--timings", symmetry_argument, gap_path_argument], pbesfile, timeout=TIMEOUT, memlimit=MEMLIMIT)
+        solving_data = run_command(mcrl2, "pbessolve", [*_PBESSOLVE_OPTIONS, symmetry_argument, _GAP_PATH_ARG],
+                                   pbesfile, timeout=TIMEOUT, memlimit=memlimit)
         logging.info(
             "Successfully solved explicit PBES with symmetry reduction.")
     except (ToolException, Timeout, OutOfMemory) as e:
@@ -519,19 +641,109 @@ def pbes_solve_symmetry(dirname, root, property_name, mcrl2, arg, symmetry):
     return solving_data
 
 
+def run_model(keys, models_path, workflows, memlimit=MEMLIMIT):
+    """Runs all workflows for all properties of the given model and returns the model with its results"""
+    data = {}
+    input_file = pathlib.Path(models_path) / keys
+    path, filename = split_input_filename(input_file)
+    logging.info("Path {}".format(path))
+    logging.info("Input model {}".format(filename))
+    logging.info("Prop path {}".format(models_path))
+    logging.info("Input path {}".format(input_file))
+
+    # step 1 linearise
+    if (("routing" in filename) or ("alloc" in filename)):
+        data["mcrl22lps"] = mcrl2_to_lps_suminst_fununfold(
+            path, filename)
+    else:
+        data["mcrl22lps"] = mcrl2_to_lps(path, filename)
+    print("--- Model: {}".format(keys))
+
+    folder_prop = pathlib.Path(prop_path) / keys
+    logging.info(
+        "Input path for properties folder: {}".format(folder_prop))
+    with os.scandir(folder_prop) as entries:
+        props = {entry.name.split('.')[0]: ['.mcf'] for entry in entries
+                 if entry.name.endswith('.mcf') and entry.is_file()}
+
+    lpsfile = lps_filepath(path, filename)
+
+    for p in props:
+        print("-- Computing with property: {}".format(p))
+        data[p] = {}
+        mcffile = property_filepath(folder_prop, p)
+        pbesfile = pbes_filepath(path, filename, p)
+        pbesfiletmp = pbes_filepath(path, filename, p, "tmp")
+
+        for w in workflows:
+            hint = w
+            data[p][format(hint)] = {}
+
+            # # step 2 LPS2PBES
+            data[p][format(hint)]["lps2pbes"] = lps_to_pbes(
+                lpsfile, mcffile, pbesfile, mcrl2_Path, memlimit)
+
+            if p in REWRITEPROPERTIES:
+                data[p][format(hint)]["pbesrewr"] = pbes_rewr(
+                    pbesfile, pbesfiletmp, mcrl2_Path)
+
+            # # step 3 PBESSYMMETRY
+            if hint != 'original':
+                if hint == 'first' or hint == 'all':
+                    sym_res = pbes_symmetry(
+                        pbesfile, mcrl2_Path, hint, memlimit)
+                    data[p][format(hint)]["pbessymmetry"] = sym_res
+                    symmetries = (sym_res or {}).get("symmetries")
+                    if not symmetries:
+                        continue
+
+                    symmetries = data[p][format(
+                        hint)]["pbessymmetry"]["symmetries"]
+                    symmetry_cycle = element_with_longest_cycle(symmetries)
+                    data[p][format(
+                        hint)]["symmetry_used"] = symmetry_cycle
+                    symmetry = cycles_to_function_notation(symmetry_cycle)
+                elif hint == "chosen":
+                    symmetry_cycle = get_chosen_symmetry(keys, p)
+                    data[p][format(
+                        hint)]["symmetry_used"] = symmetry_cycle
+                    symmetry = cycles_to_function_notation(symmetry_cycle)
+
+            # # step 4 PBESSOLVE
+            if hint == "original":
+                data[p][format(hint)]["pbessolve"] = pbes_solve(
+                    pbesfile, mcrl2_Path, hint, memlimit=memlimit)
+            else:
+                data[p][format(hint)]["pbessolve"] = pbes_solve(
+                    pbesfile, mcrl2_Path, hint, symmetry, memlimit=memlimit)
+
+    return keys, data
+
+
+def positive_int(value):
+    """Converts a command line argument to an integer that is at least one"""
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError("{} is not a positive number".format(value))
+    return number
+
+
 def main():
-    global memorylimit
     models_path = ''
-    data = {}
 
     # Initialize parser
     parser = argparse.ArgumentParser()
     # Adding optional argument
     parser.add_argument("--memory-limit", dest="memory", help="memory limit")
-    parser.add_argument("--workflow", dest="workflow",
+    parser.add_argument("--workflow", dest="workflow", choices=WORKFLOWS, default="first-chosen",
                         help="\"chosen-first\" (default), \"chosen\" , \"first\" or \"all\" symmetries")
-    parser.add_argument("--selection", dest="selection",
+    parser.add_argument("--selection", dest="selection", choices=SELECTIONS, default="m",
                         help="Choose size of model set, \"s\", \"m\" (default) or \"l\"")
+    parser.add_argument("--jobs", dest="jobs", type=positive_int, default=1,
+                        help="Number of models that are run in parallel (default is 1). Running models "
+                             "in parallel influences the measured times")
+    parser.add_argument("--resume", action="store_true",
+                        help="Keep the results in the yaml file and skip the models that it already contains")
     parser.add_argument("folder", help="Folder with models")
     parser.add_argument("yamlfile", help="Yaml file to save data")
     parser.add_argument("loggingfile", help="Logging file", nargs="?")
@@ -542,31 +754,17 @@ def main():
     yamlfile = args.yamlfile
     loggingfile = args.loggingfile
 
-    if args.workflow is None or args.workflow == "first-chosen":
-        workflows = WORKFLOWS_FIRST_CHOSEN
-    elif args.workflow == "chosen":
-        workflows = WORKFLOWS_CHOSEN
-    elif args.workflow == "first":
-        workflows = WORKFLOWS_FIRST
-    elif args.workflow == "all":
-        workflows = WORKFLOWS_ALL
-
-    if args.selection is not None:
-        selectionoption = args.selection
-    else:
-        selectionoption = "m"
+    workflows = WORKFLOWS[args.workflow]
+    models = SELECTIONS[args.selection]
 
     if args.memory is not None:
         memorylimit = args.memory
     else:
         memorylimit = 64
-    MEMLIMIT = int(memorylimit) * 1024 * 1024
-    print(f"Memory limit {MEMLIMIT}")
 
     # Check folder path
     if args.folder is not None:
-        models_path = os.path.abspath(os.path.join(
-            os.path.split(__file__)[0], f"{folder}"))
+        models_path = pathlib.Path(os.path.abspath(pathlib.Path(__file__).parent / folder))
         if os.path.isdir(folder):
             print(f"The folder path is: {folder}")
         else:
@@ -581,96 +779,42 @@ def main():
     else:
         print("No folder path provided.")
 
-    if selectionoption == "xs":
-        models = MODELS_XS
-    elif selectionoption == "s":
-        models = MODELS_S
-    elif selectionoption == "m":
-        models = MODELS_M
-    elif selectionoption == "l":
-        models = MODELS_L
-    elif selectionoption == "xl":
-        models = MODELS_XL
-
-    for keys in models:
-        data[keys] = {}
-        input_file = os.path.join(os.path.split(
-            __file__)[0], folder, pathlib.Path(models_path), keys)
-        path, filename = split_input_filename(input_file)
-        logging.info("Path {}".format(path))
-        logging.info("Input model {}".format(filename))
-        logging.info("Prop path {}".format(models_path))
-        logging.info("Input path {}".format(input_file))
-
-        # step 1 linearise
-        if (("routing" in filename) or ("alloc" in filename)):
-            data[keys]["mcrl22lps"] = mcrl2_to_lps_suminst_fununfold(
-                path, filename)
-        else:
-            data[keys]["mcrl22lps"] = mcrl2_to_lps(path, filename)
-        print("--- Model: {}".format(keys))
-
-        folder_prop = os.path.join(os.path.split(
-            __file__)[0], 'properties', pathlib.Path(prop_path), keys)
-        logging.info(
-            "Input path for properties folder: {}".format(folder_prop))
-        folderfile = os.fsencode(folder_prop)
-        props = {}
-
-        for file in os.listdir(folderfile):
-            prop = os.fsdecode(file)
-            if prop.endswith(('.mcf')):
-                propname = prop.split('.')[0]
-                props[propname] = ['.mcf']
-
-        for p in props:
-            print("-- Computing with property: {}".format(p))
-            data[keys][p] = {}
-
-            for w in workflows:
-                hint = w
-                data[keys][p][format(hint)] = {}
-
-                # # step 2 LPS2PBES
-                data[keys][p][format(hint)]["lps2pbes"] = lps_to_pbes(
-                    path, folder_prop, filename, p, mcrl2_Path, hint)
-
-                if p in REWRITEPROPERTIES:
-                    data[keys][p][format(hint)]["pbesrewr"] = pbes_rewr(
-                        path, folder_prop, filename, p, mcrl2_Path, hint)
-
-                # # step 3 PBESSYMMETRY
-                if hint != 'original':
-                    if hint == 'first' or hint == 'all':
-                        sym_res = pbes_symmetry(
-                            path, filename, p, mcrl2_Path, hint)
-                        data[keys][p][format(hint)]["pbessymmetry"] = sym_res
-                        symmetries = (sym_res or {}).get("symmetries")
-                        if not symmetries:
-                            continue
-
-                        symmetries = data[keys][p][format(
-                            hint)]["pbessymmetry"]["symmetries"]
-                        symmetry_cycle = element_with_longest_cycle(symmetries)
-                        data[keys][p][format(
-                            hint)]["symmetry_used"] = symmetry_cycle
-                        symmetry = cycles_to_function_notation(symmetry_cycle)
-                    elif hint == "chosen":
-                        symmetry_cycle = get_chosen_symmetry(keys, p)
-                        data[keys][p][format(
-                            hint)]["symmetry_used"] = symmetry_cycle
-                        symmetry = cycles_to_function_notation(symmetry_cycle)
-
-                # # step 4 PBESSOLVE
-                if hint == "original":
-                    data[keys][p][format(hint)]["pbessolve"] = pbes_solve(
-                        path, filename, p, mcrl2_Path, hint)
-                else:
-                    data[keys][p][format(hint)]["pbessolve"] = pbes_solve(
-                        path, filename, p, mcrl2_Path, hint, symmetry)
-
-    with open(yamlfile, 'w') as file:
-        yaml.safe_dump(data, file, sort_keys=False, default_flow_style=False)
+    if _GAP_PATH is None:
+        logging.warning("Could not find gap on the PATH, solving with symmetries will fail")
+    if SafeDumper is yaml.SafeDumper:
+        logging.warning("PyYAML is installed without libyaml, writing the results will be slower")
+
+    # The yaml file is a stream with a document per model, so the results of
+    # the models that finished are kept when the script is interrupted.
+    finished = set()
+    if args.resume and os.path.exists(yamlfile):
+        with open(yamlfile, 'r') as file:
+            for document in yaml.safe_load_all(file):
+                finished.update(document or {})
+        print(f"Skipping the models in {yamlfile}: {', '.join(sorted(finished))}")
+    pending = [keys for keys in models if keys not in finished]
+
+    # The models are independent, so they can be run in parallel. The memory
+    # limit is shared equally by the jobs.
+    jobs = args.jobs
+    memlimit = int(memorylimit) * 1024 * 1024 // jobs
+    print(f"Memory limit {memlimit} for each of the {jobs} jobs")
+
+    with open(yamlfile, 'a' if args.resume else 'w') as file, \
+            concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(run_model, keys, models_path, workflows, memlimit): keys
+                   for keys in pending}
+        for future in concurrent.futures.as_completed(futures):
+            # A failing model is left out of the yaml file, the other models are still written
+            try:
+                keys, model_data = future.result()
+            except Exception as e:
+                print("Model {} failed: {}".format(futures[future], e))
+                logging.exception("Failed to run model {}".format(futures[future]))
+                continue
+            yaml.dump({keys: model_data}, file, Dumper=SafeDumper, explicit_start=True,
+                      sort_keys=False, default_flow_style=False)
+            file.flush()
 
 
 if __name__ == "__main__":
@@ -1,11 +1,17 @@
 #!/usr/bin/env python3
 import argparse
+import concurrent.futures
+import itertools
 import os
 import sys
 import re
 import csv
-from typing import Any, Dict, List
-from collections import Counter
+import functools
+import math
+import pickle
+from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, field
+from collections import Counter, namedtuple
 
 try:
     import yaml
@@ -13,37 +19,61 @@ except ImportError:
     print("This script requires PyYAML. Install it with: pip install pyyaml", file=sys.stderr)
     sys.exit(1)
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+    print("PyYAML is installed without libyaml, parsing will be slow. "
+          "Install libyaml (e.g. libyaml-dev) and reinstall pyyaml to speed it up.", file=sys.stderr)
+
 
 # -----------------------
 # Helpers
 # -----------------------
 
+LATEX_ESCAPES = str.maketrans({
+    "\\": r"\textbackslash{}",
+    "&": r"\&",
+    "%": r"\%",
+    "#": r"\#",
+    "_": r"\_",
+    "{": r"\{",
+    "}": r"\}",
+    "~": r"\textasciitilde{}",
+})
+LATEX_SPECIALS_RE = re.compile(r'[\\&%#_{}~]')
+
+
+# The names are escaped for every row they appear in. Typed, since e.g. True and 1 are
+# equal but are not escaped the same
+@functools.lru_cache(maxsize=4096, typed=True)
 def latex_escape(text: Any) -> str:
     if text is None or text == "":
         return "-"
     s = str(text)
-    replacements = {
-        "\\": r"\textbackslash{}",
-        "&": r"\&",
-        "%": r"\%",
-        "#": r"\#",
-        "_": r"\_",
-        "{": r"\{",
-        "}": r"\}",
-        "~": r"\textasciitilde{}",
-    }
-    for k, v in replacements.items():
-        s = s.replace(k, v)
+    # Most names contain no special characters and need no new string
+    if LATEX_SPECIALS_RE.search(s):
+        s = s.translate(LATEX_ESCAPES)
     return s if s.strip() else "-"
 
 
+def format_decimals(f: float, digits: int) -> str:
+    """Formats f with the given number of decimals and removes the trailing zeros."""
+    txt = f"{f:.{digits}f}"
+    if "." not in txt:
+        # No decimals, inf or nan
+        return txt
+    txt = txt.rstrip("0")
+    return txt[:-1] if txt[-1] == "." else txt
+
+
 def format_float(x: Any, digits: int = 3) -> str:
     """General float formatter for non-time fields. '-' for missing."""
     if x is None or x == "":
         return "-"
     try:
         f = float(x)
-        txt = f"{f:.{digits}f}".rstrip("0").rstrip(".")
+        txt = format_decimals(f, digits)
         return txt if txt else "-"
     except (ValueError, TypeError):
         return "-"
@@ -60,31 +90,42 @@ def format_time(x: Any, digits: int = 3) -> str:
         return "t-o"
     try:
         f = float(x)
-        txt = f"{f:.{digits}f}".rstrip("0").rstrip(".")
+        txt = format_decimals(f, digits)
         return txt if txt else "t-o"
     except (ValueError, TypeError):
         return "-"
 
 
 def format_answer(ans: Any) -> str:
+    # The answers are nearly always the booleans or strings true and false, which are checked first
+    if ans is True or ans == "true":
+        return r"$\checkmark$"
+    if ans is False or ans == "false":
+        return r"$\times$"
     if ans is None or ans == "":
         return "-"
-    s = str(ans).lower()
-    if s == "true":
+    s = str(ans)
+    lower = s.lower()
+    if lower == "true":
         return r"$\checkmark$"
-    if s == "false":
+    if lower == "false":
         return r"$\times$"
-    return str(ans)
+    return s
 
 
+VARIANTS = ("original", "first", "chosen")
+VARIANT_BITS = {variant: 1 << i for i, variant in enumerate(VARIANTS)}
 TIME_FIELDS = ("instantiation", "solving")
 
+# Matches the contents of a single cycle "(...)" in a permutation
+CYCLE_RE = re.compile(r'\(([^)\n]*)\)')
+
 
 def permutation_size_str(perm: str) -> str:
     if not perm or perm.strip() == "()":
         return "1"
 
-    cycles = re.findall(r'\((.*?)\)', perm)
+    cycles = CYCLE_RE.findall(perm)
     sizes = [len(cycle.split()) for cycle in cycles if cycle.strip()]
     if not sizes:
         return "1"
@@ -104,70 +145,106 @@ def permutation_size_str(perm: str) -> str:
 # Parsing YAML
 # -----------------------
 
-def collect_rows_from_yaml(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+# A single result of a variant of a property in an input file
+Row = namedtuple("Row", "model property variant answer bes_eqs instantiation solving "
+                        "symmetry_used symmetry_detection",
+                 defaults=(None, None, None, None, None, None))
+
+
+def intern_key(key: Any) -> Any:
+    """Interns model and property names, such that comparing equal keys is mostly a pointer comparison."""
+    return sys.intern(key) if type(key) is str else key
+
+
+def collect_row(model: str, prop: str, variant: str, results: Any) -> Optional[Row]:
+    """Returns the row for the results of one variant of a property, or None if it has no pbessolve results."""
+    if not isinstance(results, dict):
+        return None
+    pb = results.get("pbessolve")
+    if not isinstance(pb, dict):
+        return None
+
+    symmetry_used = None
+    symmetry_detection = None
+    if variant != "original":
+        symmetry_used = permutation_size_str(results.get("symmetry_used", ""))
+    if variant == "first":
+        sym_func = results.get("pbessymmetry", {})
+        symmetry_detection = sym_func.get("totaltime") if isinstance(sym_func, dict) else None
+
+    return Row(model, prop, variant,
+               pb.get("answer", ""),
+               pb.get("generated_bes_equations", ""),
+               pb.get("instantiation"),
+               pb.get("solving"),
+               symmetry_used,
+               symmetry_detection)
+
+
+def collect_rows_from_yaml(data: Dict[str, Any]) -> List[Row]:
     rows = []
 
     for model, model_content in (data or {}).items():
         if not isinstance(model_content, dict):
             continue
+        model = intern_key(model)
 
         for prop, prop_content in model_content.items():
             if not isinstance(prop_content, dict):
                 continue
+            prop = intern_key(prop)
+
+            for variant in VARIANTS:
+                row = collect_row(model, prop, variant, prop_content.get(variant))
+                if row is not None:
+                    rows.append(row)
+
+    return rows
+
+
+def parse_rows(path: str):
+    """Parses a YAML file written by run.py. Returns None if it contains no results."""
+    # run.py writes a YAML stream with one document per model
+    data = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for document in yaml.load_all(f, Loader=SafeLoader):
+            if isinstance(document, dict):
+                data.update(document)
+    return collect_rows_from_yaml(data) if data else None
+
+
+# Increase when the rows returned by collect_rows_from_yaml change
+ROWS_CACHE_VERSION = 2
 
-            # Original
-            original = prop_content.get("original", {})
-            if isinstance(original, dict):
-                pb = original.get("pbessolve")
-                if isinstance(pb, dict):
-                    rows.append({
-                        "model": model,
-                        "property": prop,
-                        "variant": "original",
-                        "answer": pb.get("answer", ""),
-                        "bes_eqs": pb.get("generated_bes_equations", ""),
-                        "instantiation": pb.get("instantiation"),
-                        "solving": pb.get("solving"),
-                    })
-
-            # First
-            first = prop_content.get("first", {})
-            if isinstance(first, dict):
-                symmetry_used = first.get("symmetry_used", "")
-                pb = first.get("pbessolve")
-                sym_func = first.get("pbessymmetry", {})
-                detection = sym_func.get("totaltime") if isinstance(sym_func, dict) else None
-
-                if isinstance(pb, dict):
-                    rows.append({
-                        "model": model,
-                        "property": prop,
-                        "variant": "first",
-                        "answer": pb.get("answer", ""),
-                        "bes_eqs": pb.get("generated_bes_equations", ""),
-                        "instantiation": pb.get("instantiation"),
-                        "solving": pb.get("solving"),
-                        "symmetry_used": permutation_size_str(symmetry_used),
-                        "symmetry_detection": detection
-                    })
-
-            # Chosen
-            chosen = prop_content.get("chosen", {})
-            if isinstance(chosen, dict):
-                symmetry_used = chosen.get("symmetry_used", "")
-                pb = chosen.get("pbessolve")
-                if isinstance(pb, dict):
-                    rows.append({
-                        "model": model,
-                        "property": prop,
-                        "variant": "chosen",
-                        "answer": pb.get("answer", ""),
-                        "bes_eqs": pb.get("generated_bes_equations", ""),
-                        "instantiation": pb.get("instantiation"),
-                        "solving": pb.get("solving"),
-                        "symmetry_used": permutation_size_str(symmetry_used),
-                    })
 
+def read_rows(path: str, use_cache: bool = False):
+    """
+    Like parse_rows, but optionally caches the rows in <path>.rows.pkl.
+    The cache is used as long as the modification time and size of path are unchanged,
+    so it is stale when path is changed without changing either.
+    """
+    if not use_cache:
+        return parse_rows(path)
+
+    st = os.stat(path)
+    key = (ROWS_CACHE_VERSION, st.st_mtime_ns, st.st_size)
+    cache_path = path + ".rows.pkl"
+    try:
+        with open(cache_path, "rb") as f:
+            cached_key, rows = pickle.load(f)
+        if cached_key == key:
+            return None if rows is None else [Row._make(row) for row in rows]
+    except Exception:
+        # A missing, unreadable or outdated cache is rebuilt
+        pass
+
+    rows = parse_rows(path)
+    try:
+        # Plain tuples, since the module of Row differs between running as a script and in a worker process
+        with open(cache_path, "wb") as f:
+            pickle.dump((key, None if rows is None else [tuple(row) for row in rows]), f, protocol=5)
+    except OSError as e:
+        print(f"Could not write cache {cache_path}: {e}", file=sys.stderr)
     return rows
 
 
@@ -175,74 +252,105 @@ def collect_rows_from_yaml(data: Dict[str, Any]) -> List[Dict[str, Any]]:
 # Aggregation (NEW FORMAT)
 # -----------------------
 
-def aggregate_rows(all_files_rows: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
-    from collections import defaultdict
+# Value of an answer latch that has seen different answers
+MIXED = object()
+
+
+def latch(current: Any, value: Any) -> Any:
+    """Returns the new state of a latch that is None until it sees its first value."""
+    if current is None or current == value:
+        return value
+    return MIXED
+
+
+@dataclass(slots=True)
+class VariantResults:
+    """The results of one variant of a (model, property) pair, over all input files."""
+    answer: Any = None  # latch, see latch()
+    bes_eqs: Optional[str] = None
+    instantiation: List[float] = field(default_factory=list)
+    solving: List[float] = field(default_factory=list)
+    symmetry_detection: List[float] = field(default_factory=list)
+
+
+def avg(xs: List[float]):
+    """Average of xs, or None if it is empty. Summed with math.fsum, so it does not depend on the order of xs."""
+    n = len(xs)
+    return math.fsum(xs) / n if n else None
+
 
-    agg = defaultdict(lambda: {
-        "original": {"answers": set(), "bes_eqs": set(), "instantiation": [], "solving": []},
-        "first": {"answers": set(), "bes_eqs": set(), "instantiation": [], "solving": [],
-                  "symmetry_detection": []},
-        "chosen": {"answers": set(), "bes_eqs": set(), "instantiation": [], "solving": []},
-    })
+def avg_sum(xs: List[float], ys: List[float]):
+    """Average of xs[i] + ys[i] over the pairs, or None if there are none. Summed with math.fsum like avg."""
+    n = min(len(xs), len(ys))
+    return math.fsum(xs[i] + ys[i] for i in range(n)) / n if n else None
+
+
+def aggregate_rows(all_files_rows: List[List[Row]]) -> List[Dict[str, Any]]:
+    agg: Dict[tuple, Dict[str, VariantResults]] = {}
 
     for rows in all_files_rows:
-        seen = set()
+        # Bit mask of the variants seen for every (model, property) pair in this file
+        seen = {}
         for r in rows:
-            key = (r["model"], r["property"], r["variant"])
-            if key in seen:
+            key = (r.model, r.property)
+            mask = seen.get(key, 0)
+            bit = VARIANT_BITS[r.variant]
+            if mask & bit:
                 continue
-            seen.add(key)
+            seen[key] = mask | bit
 
-            b = agg[(r["model"], r["property"])]
-            tgt = b[r["variant"]]
+            b = agg.get(key)
+            if b is None:
+                b = agg[key] = {variant: VariantResults() for variant in VARIANTS}
+            tgt = b[r.variant]
 
-            if r.get("answer"):
-                tgt["answers"].add(str(r["answer"]))
+            if r.answer:
+                tgt.answer = latch(tgt.answer, str(r.answer))
 
-            if r.get("bes_eqs"):
-                tgt["bes_eqs"].add(str(r["bes_eqs"]))
+            # The first size is shown, the sizes should not differ between runs
+            if r.bes_eqs and tgt.bes_eqs is None:
+                tgt.bes_eqs = str(r.bes_eqs)
 
             for tf in TIME_FIELDS:
-                v = r.get(tf)
+                v = getattr(r, tf)
                 if v not in (None, ""):
                     try:
-                        tgt[tf].append(float(v))
+                        getattr(tgt, tf).append(float(v))
                     except:
                         pass
 
-            if "symmetry_detection" in r and r["symmetry_detection"] not in (None, ""):
+            if r.symmetry_detection not in (None, ""):
                 try:
-                    b["first"]["symmetry_detection"].append(float(r["symmetry_detection"]))
+                    b["first"].symmetry_detection.append(float(r.symmetry_detection))
                 except:
                     pass
 
-    def avg(xs):
-        return sum(xs) / len(xs) if xs else None
-
     aggregated = []
 
     for (model, prop), b in agg.items():
 
         # Determine answer
-        all_answers = []
-        for variant in ("original", "first", "chosen"):
-            all_answers.extend(a for a in b[variant]["answers"] if a)
+        # The variants conflict when their latches, combined, become MIXED
+        combined = None
+        for variant in VARIANTS:
+            if b[variant].answer is not None:
+                combined = latch(combined, b[variant].answer)
 
-        if len(set(all_answers)) > 1:
+        if combined is MIXED:
             result_answer = "?"
         else:
-            if b["chosen"]["answers"]:
-                result_answer = next(iter(b["chosen"]["answers"]))
-            elif b["original"]["answers"]:
-                result_answer = next(iter(b["original"]["answers"]))
+            if b["chosen"].answer is not None:
+                result_answer = b["chosen"].answer
+            elif b["original"].answer is not None:
+                result_answer = b["original"].answer
             else:
                 result_answer = ""
 
         # Times
-        original_time = avg([i + s for i, s in zip(b["original"]["instantiation"], b["original"]["solving"])])
-        first_solve = avg([i + s for i, s in zip(b["first"]["instantiation"], b["first"]["solving"])])
-        detect = avg(b["first"]["symmetry_detection"])
-        chosen_time = avg([i + s for i, s in zip(b["chosen"]["instantiation"], b["chosen"]["solving"])])
+        original_time = avg_sum(b["original"].instantiation, b["original"].solving)
+        first_solve = avg_sum(b["first"].instantiation, b["first"].solving)
+        detect = avg(b["first"].symmetry_detection)
+        chosen_time = avg_sum(b["chosen"].instantiation, b["chosen"].solving)
 
         if first_solve is None and detect is None :
             first_time = "-"
@@ -263,9 +371,9 @@ def aggregate_rows(all_files_rows: List[List[Dict[str, Any]]]) -> List[Dict[str,
             "property": prop or "-",
             "answer": "-" if result_answer == "" else format_answer(result_answer),
 
-            "original_v": next(iter(b["original"]["bes_eqs"]), "-") or "-",
-            "first_v": next(iter(b["first"]["bes_eqs"]), "-") or "-",
-            "chosen_v": next(iter(b["chosen"]["bes_eqs"]), "-") or "-",
+            "original_v": b["original"].bes_eqs or "-",
+            "first_v": b["first"].bes_eqs or "-",
+            "chosen_v": b["chosen"].bes_eqs or "-",
 
             "original_time": original_time,
             "first_time": first_time,
@@ -292,23 +400,22 @@ def write_csv(rows: List[Dict[str, Any]], path: str, digits: int):
         w = csv.writer(f)
         w.writerow(fields)
 
-        for r in rows:
-            w.writerow([
-                r["model"],
-                r["property"],
-                r["answer"],
-
-                r["original_v"],
-                r["first_v"],
-                r["chosen_v"],
-
-                format_time(r["original_time"]),
-                # Note: first_time may be a composed string like "a + b"; original script used format_time,
-                # keeping behavior consistent with minimal change request.
-                format_time(r["first_time"]),
-                r["detection"],
-                format_time(r["chosen_time"]),
-            ])
+        w.writerows((
+            r["model"],
+            r["property"],
+            r["answer"],
+
+            r["original_v"],
+            r["first_v"],
+            r["chosen_v"],
+
+            format_time(r["original_time"]),
+            # Note: first_time may be a composed string like "a + b"; original script used format_time,
+            # keeping behavior consistent with minimal change request.
+            format_time(r["first_time"]),
+            r["detection"],
+            format_time(r["chosen_time"]),
+        ) for r in rows)
 
     print(f"Wrote CSV to: {path}")
 
@@ -344,24 +451,27 @@ def build_latex_document(rows: List[Dict[str, Any]], title: str, digits: int) ->
             txt = format_time(x)
             return txt if txt.strip() else "-"
 
-    body_rows = []
+    # All cells and separators of the body go into one list that is joined once
+    out = []
     for r in rows:
-        body_rows.append(" & ".join([
-            latex_escape(r["model"]),
-            latex_escape(r["property"]),
-            r["answer"],
-
-            latex_escape(r["original_v"]),
-            latex_escape(r["first_v"]),
-            latex_escape(r["chosen_v"]),
-
-            fmt_cell(r["original_time"]),
-            fmt_cell(r["first_time"]),
-            latex_escape(r["detection"]),     # Detection here, between first and chosen
+        if out:
+            out.append(" \\\\\n")
+        out.extend((
+            latex_escape(r["model"]), " & ",
+            latex_escape(r["property"]), " & ",
+            r["answer"], " & ",
+
+            latex_escape(r["original_v"]), " & ",
+            latex_escape(r["first_v"]), " & ",
+            latex_escape(r["chosen_v"]), " & ",
+
+            fmt_cell(r["original_time"]), " & ",
+            fmt_cell(r["first_time"]), " & ",
+            latex_escape(r["detection"]), " & ",     # Detection here, between first and chosen
             fmt_cell(r["chosen_time"]),
-        ]))
+        ))
 
-    body = " \\\\\n".join(body_rows)
+    body = "".join(out)
 
     return f"""\\documentclass{{article}}
 \\usepackage[table]{{xcolor}}
@@ -414,6 +524,9 @@ def main():
     parser.add_argument("--csv", help="Output CSV file (.csv).")
     parser.add_argument("--title", default="Benchmark Results")
     parser.add_argument("--digits", type=int, default=3)
+    parser.add_argument("--cache", action="store_true",
+                        help="Cache the parsed rows next to every input (<input>.rows.pkl) and reuse them "
+                             "while the modification time and size of the input are unchanged.")
     args = parser.parse_args()
 
     out_path = args.output or os.path.join(
@@ -422,12 +535,16 @@ def main():
 
     csv_path = args.csv or None
 
-    all_rows = []
-    for path in args.inputs:
-        with open(path, "r", encoding="utf-8") as f:
-            data = yaml.safe_load(f)
-        if isinstance(data, dict):
-            all_rows.append(collect_rows_from_yaml(data))
+    # Parsing is CPU bound, so the inputs are parsed in separate processes
+    use_cache = args.cache
+    jobs = min(len(args.inputs), os.cpu_count() or 1)
+    if jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(read_rows, args.inputs, itertools.repeat(use_cache)))
+    else:
+        results = [read_rows(path, use_cache) for path in args.inputs]
+
+    all_rows = [rows for rows in results if rows is not None]
 
     if not all_rows:
         print("No valid input files.", file=sys.stderr)
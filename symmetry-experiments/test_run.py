@@ -0,0 +1,37 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import yaml
+
+import run
+
+
+def run_model_failing_for_bad(keys, models_path, workflows, memlimit):
+    """Stands in for run.run_model, the model "bad" fails like a crashing tool"""
+    if keys == "bad":
+        raise run.ToolException(["mcrl22lps"], 1, {"err": "", "out": ""})
+    return keys, {"result": keys}
+
+
+class MainTest(unittest.TestCase):
+    def test_failing_model_keeps_other_models(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            yamlfile = os.path.join(tmp, "results.yaml")
+            argv = ["run.py", "--selection=xs", "--jobs=2", tmp, yamlfile]
+            with mock.patch.object(run, "run_model", run_model_failing_for_bad), \
+                    mock.patch.dict(run.SELECTIONS, {"xs": ["good", "bad", "other"]}), \
+                    mock.patch.object(sys, "argv", argv):
+                run.main()
+
+            with open(yamlfile) as f:
+                documents = list(yaml.safe_load_all(f))
+
+        self.assertCountEqual(documents, [{"good": {"result": "good"}},
+                                          {"other": {"result": "other"}}])
+
+
+if __name__ == "__main__":
+    unittest.main()